@@ -1,11 +1,101 @@
 """ Module containing tennis court plotting functions"""
 
+import functools
+
 from matplotlib import colors
 from matplotlib.patches import PathPatch
 from matplotlib.text import TextPath
 from matplotlib.transforms import Affine2D
 import mpl_toolkits.mplot3d.art3d as art3d
 import matplotlib.font_manager as fm
+import numpy as np
+
+# Regulation court dimensions in metres
+COURT_X_BOUND = 15
+COURT_Y_BOUND = 8
+COURT_Z_BOUND = 5
+
+COURT_LENGTH = 23.77
+COURT_WIDTH_SING = 8.23
+COURT_WIDTH_DOUB = 10.973
+SERVICE_BOX_LENGTH = 6.4
+
+NET_HEIGHT_POST = 1.07
+NET_HEIGHT_CENTRE = 0.91
+
+NET_WIDTH = COURT_WIDTH_DOUB + 0.5
+
+# Court geometry at ground level as arrays of 3D polylines - built once here rather than on every plot call
+# Each court line is a (start, end) pair of 3D points
+_COURT_LINES = np.array([
+    # Doubles sidelines
+    [(-COURT_LENGTH / 2, -COURT_WIDTH_DOUB / 2, 0), (COURT_LENGTH / 2, -COURT_WIDTH_DOUB / 2, 0)],
+    [(-COURT_LENGTH / 2, COURT_WIDTH_DOUB / 2, 0), (COURT_LENGTH / 2, COURT_WIDTH_DOUB / 2, 0)],
+    # Singles sidelines
+    [(-COURT_LENGTH / 2, -COURT_WIDTH_SING / 2, 0), (COURT_LENGTH / 2, -COURT_WIDTH_SING / 2, 0)],
+    [(-COURT_LENGTH / 2, COURT_WIDTH_SING / 2, 0), (COURT_LENGTH / 2, COURT_WIDTH_SING / 2, 0)],
+    # Baselines
+    [(-COURT_LENGTH / 2, -COURT_WIDTH_DOUB / 2, 0), (-COURT_LENGTH / 2, COURT_WIDTH_DOUB / 2, 0)],
+    [(COURT_LENGTH / 2, -COURT_WIDTH_DOUB / 2, 0), (COURT_LENGTH / 2, COURT_WIDTH_DOUB / 2, 0)],
+    # Service lines
+    [(-SERVICE_BOX_LENGTH, -COURT_WIDTH_SING / 2, 0), (-SERVICE_BOX_LENGTH, COURT_WIDTH_SING / 2, 0)],
+    [(SERVICE_BOX_LENGTH, -COURT_WIDTH_SING / 2, 0), (SERVICE_BOX_LENGTH, COURT_WIDTH_SING / 2, 0)],
+    # Centre service line
+    [(-SERVICE_BOX_LENGTH, 0, 0), (SERVICE_BOX_LENGTH, 0, 0)],
+    # Baseline centre markers
+    [(COURT_LENGTH / 2, 0, 0), ((COURT_LENGTH / 2) - 0.2, 0, 0)],
+    [(-COURT_LENGTH / 2, 0, 0), ((-COURT_LENGTH / 2) + 0.2, 0, 0)],
+])
+
+# Net mesh as short segments - vertical strings from the ground up to the cord, and horizontal strings that follow the
+# dip of the cord towards the centre strap. Much cheaper to draw than a hatched polygon
+_NET_MESH_Y = np.linspace(-NET_WIDTH / 2, NET_WIDTH / 2, 40)
+_NET_MESH_ROWS = np.linspace(0, 1, 8)  # Fraction of the cord height at each point along the net
+
+
+def _net_cord_height(y):
+    return NET_HEIGHT_CENTRE + (NET_HEIGHT_POST - NET_HEIGHT_CENTRE) * np.abs(y) / (NET_WIDTH / 2)
+
+
+_NET_MESH = np.concatenate([
+    # Vertical strings
+    np.stack([np.stack([np.zeros_like(_NET_MESH_Y), _NET_MESH_Y, np.zeros_like(_NET_MESH_Y)], axis=-1),
+              np.stack([np.zeros_like(_NET_MESH_Y), _NET_MESH_Y, _net_cord_height(_NET_MESH_Y)], axis=-1)], axis=1),
+    # Horizontal strings - each row is split at the centre strap so it dips with the cord
+    np.array([[(0, y0, row * _net_cord_height(y0)), (0, y1, row * _net_cord_height(y1))]
+              for row in _NET_MESH_ROWS
+              for y0, y1 in ((-NET_WIDTH / 2, 0), (0, NET_WIDTH / 2))]),
+])
+
+# Net posts left and right
+_NET_POSTS = np.array([
+    [(0, -NET_WIDTH / 2, 0), (0, -NET_WIDTH / 2, NET_HEIGHT_POST)],
+    [(0, NET_WIDTH / 2, 0), (0, NET_WIDTH / 2, NET_HEIGHT_POST)],
+])
+
+_NET_CORD = np.array([
+    [(0, -NET_WIDTH / 2, NET_HEIGHT_POST), (0, 0, NET_HEIGHT_CENTRE), (0, NET_WIDTH / 2, NET_HEIGHT_POST)],
+])
+
+for _arr in (_COURT_LINES, _NET_MESH, _NET_POSTS, _NET_CORD):
+    _arr.setflags(write=False)
+del _arr
+
+TEXT_FONT = 'fonts/FiraSans-ThinItalic.ttf'
+
+
+@functools.lru_cache(maxsize=4)
+def _load_font(fname):
+    """ Parses the font file once and reuses the FontProperties on subsequent calls"""
+    return fm.FontProperties(fname=fname)
+
+
+@functools.lru_cache(maxsize=128)
+def _text_path(s, size, angle, usetex, fname):
+    """ Builds the rotated glyph outline for *s* at the origin once per string/size/angle/font combination, so
+    repeated labels only need translating into place"""
+    text_path = TextPath((0, 0), s, size=size, usetex=usetex, prop=_load_font(fname))
+    return Affine2D().rotate(angle).transform_path(text_path)
 
 
 def plot_court_3d(ax, court_colour='cornflowerblue', line_colour='white', netpost_colour='black',
@@ -28,90 +118,12 @@ def plot_court_3d(ax, court_colour='cornflowerblue', line_colour='white', netpos
     -------
     matplotlib.axes.Axes"""
 
-    COURT_X_BOUND = 15
-    COURT_Y_BOUND = 8
-    COURT_Z_BOUND = 5
-
-    COURT_LENGTH = 23.77
-    COURT_WIDTH_SING = 8.23
-    COURT_WIDTH_DOUB = 10.973
-    SERVICE_BOX_LENGTH = 6.4
-
-    NET_HEIGHT_POST = 1.07
-    NET_HEIGHT_CENTRE = 0.91
-
-    NET_WIDTH = COURT_WIDTH_DOUB + 0.5
-
-    min_h = 0  # Z height to plot court lines - 99% use cases will be ground level i.e. 0
-
     ax.set_xlim3d([-COURT_X_BOUND, COURT_X_BOUND])
     ax.set_ylim3d([-COURT_Y_BOUND, COURT_Y_BOUND])
     ax.set_zlim3d([0, COURT_Z_BOUND])
 
-    sidelineX = [-COURT_LENGTH / 2, COURT_LENGTH / 2]
-    sidelineY = [-COURT_WIDTH_DOUB / 2, -COURT_WIDTH_DOUB / 2]
-    sidelineY2 = [COURT_WIDTH_DOUB / 2, COURT_WIDTH_DOUB / 2]
-    ax.plot(sidelineX, sidelineY, min_h, c=line_colour)
-    ax.plot(sidelineX, sidelineY2, min_h, c=line_colour)
-
-    sing_sidelineX = [-COURT_LENGTH / 2, COURT_LENGTH / 2]
-    sing_sidelineY = [-COURT_WIDTH_SING / 2, -COURT_WIDTH_SING / 2]
-    sing_sidelineY2 = [COURT_WIDTH_SING / 2, COURT_WIDTH_SING / 2]
-    ax.plot(sing_sidelineX, sing_sidelineY, min_h, c=line_colour)
-    ax.plot(sing_sidelineX, sing_sidelineY2, min_h, c=line_colour)
-
-    baselineX = [-COURT_LENGTH / 2, -COURT_LENGTH / 2]
-    baselineY = [-COURT_WIDTH_DOUB / 2, COURT_WIDTH_DOUB / 2]
-    baselineX2 = [COURT_LENGTH / 2, COURT_LENGTH / 2]
-    ax.plot(baselineX, baselineY, min_h, c=line_colour)
-    ax.plot(baselineX2, baselineY, min_h, c=line_colour)
-
-    servicelineX = [-SERVICE_BOX_LENGTH, -SERVICE_BOX_LENGTH]
-    servicelineY = [-COURT_WIDTH_SING / 2, COURT_WIDTH_SING / 2]
-    servicelineX2 = [SERVICE_BOX_LENGTH, SERVICE_BOX_LENGTH]
-    ax.plot(servicelineX, servicelineY, min_h, c=line_colour)
-    ax.plot(servicelineX2, servicelineY, min_h, c=line_colour)
-
-    centrelineX = [-SERVICE_BOX_LENGTH, SERVICE_BOX_LENGTH]
-    centrelineY = [0, 0]
-    ax.plot(centrelineX, centrelineY, min_h, c=line_colour)
-
-    # Draw baseline centre marker
-    x = [COURT_LENGTH / 2, (COURT_LENGTH / 2) - 0.2]
-    y = [0, 0]
-    x2 = [-COURT_LENGTH / 2, (-COURT_LENGTH / 2) + 0.2]
-    ax.plot(x, y, min_h, c=line_colour)
-    ax.plot(x2, y, min_h, c=line_colour)
-
-    # Draw net
-    x = [0, 0, 0, 0, 0]
-    y = [-NET_WIDTH / 2, 0, NET_WIDTH / 2, NET_WIDTH / 2, -NET_WIDTH / 2]
-    z = [NET_HEIGHT_POST, NET_HEIGHT_CENTRE, NET_HEIGHT_POST, 0, 0]
-    verts = [list(zip(x, y, z))]
-    ax.add_collection3d(art3d.Poly3DCollection(verts,
-                                               edgecolors=(0.862, 0.862, 0.862, 0.25),
-                                               facecolors=(0, 0, 0, 0),
-                                               linewidths=0.2,
-                                               alpha=0.1,
-                                               hatch='+++++'))
-
-    # Draw net post left
-    x = [0, 0]
-    y = [-NET_WIDTH / 2, -NET_WIDTH / 2]
-    z = [0, NET_HEIGHT_POST]
-    ax.plot(x, y, z, color=netpost_colour, linewidth=3)
-
-    # Draw net post right
-    x = [0, 0]
-    y = [NET_WIDTH / 2, NET_WIDTH / 2]
-    z = [0, NET_HEIGHT_POST]
-    ax.plot(x, y, z, color=netpost_colour, linewidth=3)
-
-    # Draw net cord
-    x = [0, 0, 0]
-    y = [-NET_WIDTH / 2, 0, NET_WIDTH / 2]
-    z = [NET_HEIGHT_POST, NET_HEIGHT_CENTRE, NET_HEIGHT_POST]
-    ax.plot(x, y, z, color=netcord_colour, linewidth=3)
+    attach_court(ax, build_court_geometry(), line_colour=line_colour, netpost_colour=netpost_colour,
+                 netcord_colour=netcord_colour)
 
     # Get rid of colored axes planes
     # First remove fill
@@ -151,6 +163,58 @@ def plot_court_3d(ax, court_colour='cornflowerblue', line_colour='white', netpos
     ax.set_box_aspect((2 * COURT_X_BOUND, 2 * COURT_Y_BOUND, COURT_Z_BOUND))
 
 
+def build_court_geometry(min_h=0):
+    """ Returns the vertex arrays for the court markings and net - centre of the court is (0,0)
+
+    The arrays are built once at import and shared between calls, so they are read-only.
+
+    ----------
+    min_h: float
+        Z height to plot court lines - 99% use cases will be ground level i.e. 0
+
+    Returns
+    -------
+    dict of numpy.ndarray keyed by 'lines', 'net', 'netposts' and 'netcord', each an array of 3D polylines"""
+
+    lines = _COURT_LINES if min_h == 0 else _COURT_LINES + (0, 0, min_h)
+    return {'lines': lines, 'net': _NET_MESH, 'netposts': _NET_POSTS, 'netcord': _NET_CORD}
+
+
+def attach_court(ax, geom, line_colour='white', netpost_colour='black', netcord_colour='ivory'):
+    """ Adds the court markings and net from *geom* to *ax* as one collection per element
+
+    For animations, attach the court once, draw the canvas and grab the background with
+    fig.canvas.copy_from_bbox(ax.bbox) - each frame can then restore_region the background and draw_artist only the
+    moving elements (e.g. the ball) rather than re-projecting the whole court.
+
+    ----------
+    ax: A matplotlib axis where ax = plt.gca(projection='3d')
+        The 3D axes to plot on.
+    geom: dict of numpy.ndarray
+        Court geometry as returned by build_court_geometry.
+    line_colour: Any valid matplotlib colour
+        The colour of the court line markings.
+    netpost_colour: Any valid matplotlib colour
+        The colour of the net posts.
+    netcord_colour: Any valid matplotlib colour
+        The colour of the net cord.
+
+    Returns
+    -------
+    list of mpl_toolkits.mplot3d.art3d collections added to the axes"""
+
+    artists = [
+        art3d.Line3DCollection(geom['lines'], colors=line_colour),
+        art3d.Line3DCollection(geom['net'], colors=(0.862, 0.862, 0.862, 0.25), linewidths=0.2),
+        art3d.Line3DCollection(geom['netposts'], colors=netpost_colour, linewidths=3),
+        art3d.Line3DCollection(geom['netcord'], colors=netcord_colour, linewidths=3),
+    ]
+    for artist in artists:
+        ax.add_collection3d(artist)
+
+    return artists
+
+
 def text3d(ax, xyz, s, zdir="z", size=None, angle=0, usetex=False, facecolor='black', edgecolor='black', **kwargs):
     """
     https://matplotlib.org/stable/gallery/mplot3d/pathpatch3d.html
@@ -172,12 +236,8 @@ def text3d(ax, xyz, s, zdir="z", size=None, angle=0, usetex=False, facecolor='bl
     else:
         xy1, z1 = (x, y), z
 
-    # Load font
-    fname = 'fonts/FiraSans-ThinItalic.ttf'
-    fp = fm.FontProperties(fname=fname)
-
-    text_path = TextPath((0, 0), s, size=size, usetex=usetex, prop=fp)
-    trans = Affine2D().rotate(angle).translate(xy1[0], xy1[1])
+    text_path = _text_path(s, size, angle, usetex, TEXT_FONT)
+    trans = Affine2D().translate(xy1[0], xy1[1])
 
     p1 = PathPatch(trans.transform_path(text_path), facecolor=facecolor, edgecolor=edgecolor, fill=True)
     p1.set_alpha(None)  # Very important - needed so alpha is respected
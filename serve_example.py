@@ -1,27 +1,75 @@
 # Example demonstrating plotting of ball tracking data on a tennis court
 
 import matplotlib.pyplot as plt
-from scipy.stats import gaussian_kde
 from plotting import plot_court_3d, text3d
 import numpy as np
 import pandas as pd
 from matplotlib.colors import ListedColormap
-from scipy import interpolate
-
-
-# Helper function to get gaussian kde for plotting - returns X,Y grid and Z density
-def get_density(data):
-    xmin = min(data[:, 0])
-    xmax = max(data[:, 0])
-    ymin = min(data[:, 1])
-    ymax = max(data[:, 1])
-
-    X, Y = np.mgrid[xmin:xmax:100j, ymin:ymax:100j]
-    positions = np.vstack([X.ravel(), Y.ravel()])
-
-    kernel = gaussian_kde(data.T, bw_method=0.35)
-    Z = np.reshape(kernel(positions).T, X.shape)
-    return X, Y, Z
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from scipy import linalg
+
+
+# Helper class for gaussian kde on a fixed grid via binning and FFT convolution - the kernel FFT is built once so
+# several datasets can be evaluated against it. extent is (xmin, xmax, ymin, ymax) and should cover all the data
+class FFTGaussianKDE:
+    def __init__(self, cov, extent, grid_n=None):
+        self.xmin, xmax, self.ymin, ymax = extent
+
+        # Default grid pitch is about a third of the kernel standard deviation, with at least 32 points a side
+        if grid_n is None:
+            pitch = np.sqrt(np.diag(cov)) / 3
+            self.nx = max(32, int(np.ceil((xmax - self.xmin) / pitch[0])) + 1)
+            self.ny = max(32, int(np.ceil((ymax - self.ymin) / pitch[1])) + 1)
+        else:
+            self.nx, self.ny = grid_n, grid_n
+
+        self.X, self.Y = np.mgrid[self.xmin:xmax:self.nx * 1j, self.ymin:ymax:self.ny * 1j]
+        self.dx = (xmax - self.xmin) / (self.nx - 1)
+        self.dy = (ymax - self.ymin) / (self.ny - 1)
+
+        # Gaussian kernel image on the same grid pitch, truncated at 4 standard deviations either side
+        self.kx = int(np.ceil(4 * np.sqrt(cov[0, 0]) / self.dx))
+        self.ky = int(np.ceil(4 * np.sqrt(cov[1, 1]) / self.dy))
+        # Open grids of the x and y offsets broadcast against each other, so no flattened (2, M) copy is needed
+        off_x, off_y = np.ogrid[-self.kx:self.kx + 1, -self.ky:self.ky + 1]
+        off_x = off_x * self.dx
+        off_y = off_y * self.dy
+
+        # Whiten the offsets against the Cholesky factor rather than forming the inverse covariance - for a 2x2 lower
+        # triangular factor the solve is just two lines of forward substitution
+        L = linalg.cholesky(cov, lower=True)
+        u0 = off_x / L[0, 0]
+        u1 = (off_y - L[1, 0] * u0) / L[1, 1]
+        kern = np.exp(-0.5 * (u0 ** 2 + u1 ** 2)) / (2 * np.pi * L[0, 0] * L[1, 1])  # det(cov) = (L00 * L11) ** 2
+
+        # Zero pad to the full convolution size so nothing wraps around
+        self.fft_shape = (self.nx + 2 * self.kx, self.ny + 2 * self.ky)
+        self.kern_fft = np.fft.rfft2(kern, self.fft_shape)
+
+    # Returns X,Y grid and Z density for data
+    def evaluate(self, data):
+        nx, ny = self.nx, self.ny
+
+        # Bin the data onto the grid - each point is shared between its four surrounding grid points in proportion to
+        # how close it is to each (linear binning), which keeps the estimate accurate on a coarse grid
+        fx = (data[:, 0] - self.xmin) / self.dx
+        fy = (data[:, 1] - self.ymin) / self.dy
+        ix = np.clip(np.floor(fx).astype(int), 0, nx - 2)
+        iy = np.clip(np.floor(fy).astype(int), 0, ny - 2)
+        wx = fx - ix
+        wy = fy - iy
+        idx = ix * ny + iy
+        counts = (np.bincount(idx, (1 - wx) * (1 - wy), nx * ny) +
+                  np.bincount(idx + 1, (1 - wx) * wy, nx * ny) +
+                  np.bincount(idx + ny, wx * (1 - wy), nx * ny) +
+                  np.bincount(idx + ny + 1, wx * wy, nx * ny)).reshape(nx, ny)
+
+        # Convolve in the frequency domain against the cached kernel FFT, then crop back to the grid
+        conv = np.fft.irfft2(np.fft.rfft2(counts, self.fft_shape) * self.kern_fft, self.fft_shape)
+        Z = conv[self.kx:self.kx + nx, self.ky:self.ky + ny] / len(data)
+        Z = np.clip(Z, 0, None)  # FFT round-off can leave tiny negative values
+        return self.X, self.Y, Z
 
 
 # Helper function to integrate increasing alpha into cmap i.e. transparent when low and opaque when high
@@ -40,18 +88,40 @@ def cmap_alpha(min_colour, max_colour):
     return alpha_cmap
 
 
-# Helper function to fit a parabola curve (not surface) to date on a 3D axis - we'll use scipy spline functionality
-def fit_parabola3d(x, y, z, npoints):
-    #t = np.linspace(0, len(x) - 1, len(x) - 1)
-    x = x
-    y = y
-    z = z
+# Helper function to trace the contour lines of Z as 3D segments at height z, with one colour per segment - this lets
+# several density maps share a single collection on the 3D axis instead of each adding its own contour set
+def contour_segments(X, Y, Z, levels, cmap, z=0):
+    cs = Figure().add_subplot().contour(X, Y, Z, levels, cmap=cmap)  # Throwaway axes, only used to trace the lines
+    level_colours = cs.cmap(cs.norm(cs.levels))
+
+    segments = []
+    colours = []
+    for level_segs, colour in zip(cs.allsegs, level_colours):
+        for seg in level_segs:
+            segments.append(np.column_stack([seg, np.full(len(seg), z)]))
+            colours.append(colour)
+
+    return segments, colours
+
 
-    tck, u = interpolate.splprep([x, y, z], s=1, k=len(x) - 1)
-    u_fine = np.linspace(0, 1, npoints)
-    x_fine, y_fine, z_fine = interpolate.splev(u_fine, tck)
+# Helper function to fit parabola curves (not surfaces) to a batch of tracks on a 3D axis - points has shape
+# (n_tracks, n_points, 3) and each co-ordinate is fitted as a quadratic (or a straight line for two points) in the
+# normalised cumulative chord length along the track, as scipy's splprep does, with all tracks solved in one batch
+def fit_parabola3d(points, npoints):
+    n_tracks, n_points, _ = points.shape
+    deg = min(2, n_points - 1)
 
-    return x_fine, y_fine, z_fine
+    chord = np.linalg.norm(np.diff(points, axis=1), axis=2)
+    u = np.concatenate([np.zeros((n_tracks, 1)), np.cumsum(chord, axis=1)], axis=1)
+    u /= u[:, -1:]
+
+    # Least squares via the normal equations so each track can have its own Vandermonde matrix
+    V = u[:, :, None] ** np.arange(deg, -1, -1)
+    Vt = V.transpose(0, 2, 1)
+    coefs = np.linalg.solve(Vt @ V, Vt @ points)
+
+    V_fine = np.vander(np.linspace(0, 1, npoints), deg + 1)
+    return V_fine @ coefs
 
 
 # ---------- DATA PREPARATION -----------------------
@@ -65,11 +135,11 @@ cutoff_x = 7.4  # box x + 1m
 cutoff_y = 6.487  # box y + 1m
 
 # Anything outside cut-off can be classed as wayward and we'll filter out net faults
-djokovic_1stserves = pbp_data[(pbp_data['server_id'] == 9801) &
-                              (pbp_data['serve_num'] == 1) &
-                              (pbp_data['error_type'] != 'Net Error') &
-                              (abs(pbp_data['x_serve_bounce']) <= cutoff_x) &
-                              (abs(pbp_data['y_serve_bounce']) <= cutoff_y)]
+djokovic_1stserves = pbp_data.query("server_id == 9801 and "
+                                    "serve_num == 1 and "
+                                    "error_type != 'Net Error' and "
+                                    "abs(x_serve_bounce) <= @cutoff_x and "
+                                    "abs(y_serve_bounce) <= @cutoff_y")
 
 # We'll extract aces as well and find their point_ids for lookup with detailed tracking
 djokovic_aces = djokovic_1stserves[djokovic_1stserves['is_ace'] == 1]
@@ -81,13 +151,15 @@ track_ids = list(djokovic_aces['point_ID'])
 
 xy_deuce = np.array(
     djokovic_1stserves[djokovic_1stserves['court_side'] == 'DeuceCourt'][['x_serve_bounce', 'y_serve_bounce']])
-flipped = xy_deuce[:, 0] < 0
-xy_deuce[flipped] = 0 - xy_deuce[flipped]
+sign = np.sign(xy_deuce[:, 0])
+sign[sign == 0] = 1
+xy_deuce *= sign[:, None]
 
 xy_ad = np.array(
     djokovic_1stserves[djokovic_1stserves['court_side'] == 'AdCourt'][['x_serve_bounce', 'y_serve_bounce']])
-flipped = xy_ad[:, 0] < 0
-xy_ad[flipped] = 0 - xy_ad[flipped]
+sign = np.sign(xy_ad[:, 0])
+sign[sign == 0] = 1
+xy_ad *= sign[:, None]
 
 # ------------------ PLOTTING ----------------------------
 
@@ -102,6 +174,7 @@ court_colour = (0.603, 0.184, 0.035, 1)
 ace_colour = 'pink'
 deuce_textcolor = (0.203, 0.435, 0.325, 0.5)
 ad_textcolor = (0.886, 0.454, 0.070, 0.5)
+kde_bw_method = 0.35  # Bandwidth factor applied to the kernel covariance, as per scipy's gaussian_kde
 
 # Generate a tennis court
 plot_court_3d(ax, court_colour=court_colour, netcord_colour='ivory', netpost_colour='black')
@@ -130,46 +203,69 @@ text3d(ax, (14, 5, 0),
 # Set the "camera" position
 ax.view_init(elev=20, azim=10)
 
-# Plot some contour maps on the court for the service bounce points
-X, Y, Z_deuce = get_density(xy_deuce)
-ax.contour(X, Y, Z_deuce, 10, cmap=cmap_alpha(court_colour, 'teal'), linestyles="solid", offset=0)
+# Bounce points for both courts stacked once - used for the shared density grid and the bounce scatter
+xy_serves = np.vstack([xy_deuce, xy_ad])
+
+# Plot some contour maps on the court for the service bounce points - both courts go into one collection
+# Both densities share one grid and kernel, with the kernel covariance pooled from within each court so the spread
+# between the two courts doesn't widen it
+extent = (min(xy_serves[:, 0]), max(xy_serves[:, 0]), min(xy_serves[:, 1]), max(xy_serves[:, 1]))
+pooled_cov = (((len(xy_deuce) - 1) * np.cov(xy_deuce.T) + (len(xy_ad) - 1) * np.cov(xy_ad.T)) /
+              (len(xy_serves) - 2))
+serve_kde = FFTGaussianKDE(pooled_cov * kde_bw_method ** 2, extent)
+
+X, Y, Z_deuce = serve_kde.evaluate(xy_deuce)
+deuce_segments, deuce_colours = contour_segments(X, Y, Z_deuce, 10, cmap_alpha(court_colour, 'teal'))
 
-X, Y, Z_ad = get_density(xy_ad)
-ax.contour(X, Y, Z_ad, 10, cmap=cmap_alpha(court_colour, 'orange'), linestyles="solid", offset=0)
+X, Y, Z_ad = serve_kde.evaluate(xy_ad)
+ad_segments, ad_colours = contour_segments(X, Y, Z_ad, 10, cmap_alpha(court_colour, 'orange'))
 
-# Plot the bounce points as a scatter
-ax.scatter(xy_deuce[:, 0], xy_deuce[:, 1], c='teal', edgecolor='black', alpha=0.5)
-ax.scatter(xy_ad[:, 0], xy_ad[:, 1], c='orange', edgecolor='black', alpha=0.5)
+ax.add_collection3d(Line3DCollection(deuce_segments + ad_segments, colors=deuce_colours + ad_colours,
+                                     linestyles="solid"))
+
+# Plot the bounce points for both courts as a single scatter
+bounce_colours = ['teal'] * len(xy_deuce) + ['orange'] * len(xy_ad)
+ax.scatter(xy_serves[:, 0], xy_serves[:, 1], 0, c=bounce_colours, edgecolor='black', alpha=0.5)
 
 # Plot the aces as lines with interpolated ball tracking - note this is not the real ball physics!
+# Aces are fitted in batches and their markers drawn as one scatter rather than one artist per ace
+# Tracks don't all have the same tracked positions (some include the peak of the ball flight as well as the hit, net,
+# bounce and last positions) so they are batched by their number of points
+ace_tracks = {}
+tracking_by_point = tracking_data.groupby('point_ID', sort=False)
 for id in track_ids:
 
-    # Get the aces from the tracking data
-    data = tracking_data[tracking_data['point_ID'] == id]
+    # Get the aces from the tracking data - the column selection is a copy so we can flip it in place
+    xyz = tracking_by_point.get_group(id)[['x', 'y', 'z']].to_numpy()
 
     # Flip relevant serves so they all from one end
-    if data.iloc[0]['x'] > 0:
-        data.loc[:, ['x', 'y']] = data.loc[:, ['x', 'y']] * -1
+    if xyz[0, 0] > 0:
+        xyz[:, :2] *= -1
+
+    ace_tracks.setdefault(len(xyz), []).append(xyz)
+
+ace_xyz = []
+for tracks in ace_tracks.values():
+    tracks = np.stack(tracks)
 
-    # Plot separate curves for the down phase and up phase of the ball, to mimic a bouncing ball trajectory
-    data_down = data.iloc[0:3, :]
-    down_x, down_y, down_z = fit_parabola3d(data_down['x'], data_down['y'], data_down['z'], 100)
-    data_up = data.iloc[2:, :]
-    up_x, up_y, up_z = fit_parabola3d(data_up['x'], data_up['y'], data_up['z'], 100)
+    # Fit separate curves for the down phase and up phase of the ball, to mimic a bouncing ball trajectory
+    down = fit_parabola3d(tracks[:, 0:3], 100)
+    up = fit_parabola3d(tracks[:, 2:], 100)
 
-    x = np.concatenate([down_x, up_x])
-    y = np.concatenate([down_y, up_y])
-    z = np.concatenate([down_z, up_z])
+    # Keep every other point for the circular markers
+    ace_xyz.append(np.concatenate([down, up], axis=1)[:, ::2].reshape(-1, 3))
 
-    # Plot each line with circular marker
-    ax.plot(x, y, z, c=ace_colour, linestyle='None', marker='o', linewidth=3, markevery=2, markersize=3, alpha=0.5)
+# There may be no aces to plot at all, in which case we just skip the trajectories
+if ace_xyz:
+    ace_xyz = np.concatenate(ace_xyz)
+    ax.scatter(ace_xyz[:, 0], ace_xyz[:, 1], ace_xyz[:, 2], c=ace_colour, marker='o', s=9, alpha=0.5,
+               depthshade=False)
 
 # We'll plot the ball tracking key on the court as opposed to a matplotlib legend
 key_nmarkers = 7  # Number of markers
 key_y = np.linspace(4.75, 6.25, key_nmarkers)  # Evenly spaced y axis
 
-# Plot the key as a line plot segment with circular marker as per the actual tracking plots
-ax.plot(np.repeat(13.3, key_nmarkers), key_y, np.repeat(0, key_nmarkers), c=ace_colour, linestyle='None',
-        marker='o', linewidth=3, markevery=1, markersize=3, alpha=0.5)
+# Plot the key with the same circular markers as the actual tracking plots
+ax.scatter(np.full(key_nmarkers, 13.3), key_y, 0, c=ace_colour, marker='o', s=9, alpha=0.5, depthshade=False)
 
 plt.show()